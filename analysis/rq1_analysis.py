@@ -3,11 +3,17 @@
 
 Note: In this execution environment, pandas/openpyxl/matplotlib are unavailable.
 This script uses pure Python stdlib to keep the workflow reproducible.
+If python-isal happens to be installed, it is used for PNG compression.
 """
 from __future__ import annotations
-import csv, json, math, os, re, statistics, zipfile, zlib
+import array, concurrent.futures, csv, functools, math, operator, os, re, zipfile, zlib
 import xml.etree.ElementTree as ET
-from collections import Counter, defaultdict
+from collections import defaultdict
+
+try:
+    from isal import isal_zlib as zlib_impl
+except ImportError:
+    zlib_impl = zlib
 
 ROOT = os.path.dirname(os.path.dirname(__file__))
 DATA_CANDIDATES = [
@@ -16,6 +22,11 @@ DATA_CANDIDATES = [
 ]
 
 NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+TAG_SI = f"{NS}si"
+TAG_T = f"{NS}t"
+TAG_ROW = f"{NS}row"
+TAG_C = f"{NS}c"
+TAG_V = f"{NS}v"
 LIKERT5 = {
     "Strongly disagree": 1,
     "Somewhat disagree": 2,
@@ -47,6 +58,7 @@ Q30 = {
     "It was the primary factor in my decision to pursue a graduate program.": 4,
     "It was the only reason I chose to pursue a graduate program.": 5,
 }
+LIKERT_UNION = frozenset(LIKERT5) | frozenset(LIKELIHOOD5) | frozenset(IMPORTANCE5) | frozenset(Q55) | frozenset(Q6) | frozenset(Q30)
 
 FACTOR_MAP = {
     "Q30": ("150-credit education requirement influenced graduate enrollment", Q30),
@@ -59,6 +71,22 @@ FACTOR_MAP = {
 
 OPEN_ENDED_FIELDS = ["Q32", "Q36", "Q38", "Q45", "Q50", "Q56", "Q59", "Q9"]
 
+# Checked in order; the first theme with a matching keyword wins.
+QUOTE_THEMES = [
+    ("cost", ["tuition", "afford", "loan", "cost", "debt", "expensive"]),
+    ("time", ["time", "years", "delay", "full-time", "hours", "workload"]),
+    ("exam difficulty", ["exam", "pass rate", "cpa prep", "study"]),
+    ("employer support", ["employer", "job offer", "promotion", "firm"]),
+    ("education requirement", ["150", "credit hour", "graduate degree", "master", "macc", "mba"]),
+    ("work experience requirement", ["experience", "work experience", "2 years", "extra year"]),
+    ("ROI/value", ["earn", "salary", "lifetime", "return", "roi", "payoff", "career ladder"]),
+    ("awareness/confusion", ["aware", "know", "confus", "pathway", "understand"]),
+    ("equity/access", ["low-income", "family", "access", "equity", "children"]),
+]
+THEME_PATTERNS = [(re.compile("|".join(map(re.escape, kws))), name) for name, kws in QUOTE_THEMES]
+REDACT_EMAIL_RE = re.compile(r"[\w\.-]+@[\w\.-]+")
+REDACT_PHONE_RE = re.compile(r"\b\+?\d?[\d\-\(\) ]{8,}\b")
+
 
 def find_excel_files():
     files = []
@@ -75,112 +103,168 @@ def col_key(col):
     return (len(col), col)
 
 
-def parse_xlsx(path):
-    with zipfile.ZipFile(path) as z:
-        ss = []
-        sroot = ET.fromstring(z.read("xl/sharedStrings.xml"))
-        for si in sroot.findall(f"{NS}si"):
-            ss.append("".join((t.text or "") for t in si.iter(f"{NS}t")))
-        sheet = ET.fromstring(z.read("xl/worksheets/sheet1.xml"))
-        rows = []
-        for r in sheet.findall(f".//{NS}row"):
+def read_shared_strings(z):
+    ss = []
+    with z.open("xl/sharedStrings.xml") as fh:
+        for _, si in ET.iterparse(fh):
+            if si.tag == TAG_SI:
+                ss.append("".join((t.text or "") for t in si.iter(TAG_T)))
+                si.clear()
+    return tuple(ss)
+
+
+def iter_sheet_rows(z, ss):
+    # Stream rows with iterparse so the sheet is never held as a full DOM.
+    with z.open("xl/worksheets/sheet1.xml") as fh:
+        for _, r in ET.iterparse(fh):
+            if r.tag != TAG_ROW:
+                continue
             rec = {}
-            for c in r.findall(f"{NS}c"):
+            for c in r.findall(TAG_C):
                 ref = c.attrib["r"]
                 col = "".join(ch for ch in ref if ch.isalpha())
                 t = c.attrib.get("t")
-                v = c.find(f"{NS}v")
+                v = c.find(TAG_V)
                 raw = "" if v is None else (v.text or "")
-                rec[col] = ss[int(raw)] if t == "s" and raw.isdigit() else raw
-            rows.append(rec)
+                # Shared-string cells always carry an integer index.
+                if t == "s":
+                    rec[col] = ss[int(raw)] if raw else ""
+                else:
+                    rec[col] = raw
+            r.clear()
+            yield rec
 
-    cols = sorted(rows[1].keys(), key=col_key)
-    names = {c: rows[1].get(c, "") for c in cols}
-    questions = {names[c]: rows[2].get(c, "") for c in cols}
 
-    data = []
-    for rr in rows[4:]:
-        d = {names[c]: (rr.get(c, "") or "").strip() for c in cols}
-        data.append(d)
+def parse_xlsx(path, finished_only=False):
+    with zipfile.ZipFile(path) as z:
+        rows = iter_sheet_rows(z, read_shared_strings(z))
+        header = [next(rows) for _ in range(4)]
+        cols = sorted(header[1].keys(), key=col_key)
+        names = {c: header[1].get(c, "") for c in cols}
+        questions = {names[c]: header[2].get(c, "") for c in cols}
+        # Skip partial responses before building their record.
+        finished = next((c for c in cols if names[c] == "Finished"), None)
+        named_cols = list(names.items())
+
+        data = []
+        for rr in rows:
+            if finished_only and rr.get(finished, "").strip() != "1":
+                continue
+            d = {name: rr.get(c, "").strip() for c, name in named_cols}
+            data.append(d)
     return data, questions
 
 
 def classify_field(values, name, qtext):
-    nonempty = [v for v in values if v != ""]
-    if not nonempty:
+    text_hint = name.endswith("_TEXT") or "Please explain" in qtext or "Please briefly" in qtext or "Please share" in qtext
+    # More than len(LIKERT_UNION) distinct values already rules out the
+    # Likert and multi-choice types, so stop collecting past that point.
+    uniq = set()
+    for v in values:
+        if v == "":
+            continue
+        if text_hint or len(v) > 120:
+            return "text"
+        if len(uniq) <= len(LIKERT_UNION):
+            uniq.add(v)
+    if not uniq:
         return "other"
-    uniq = set(nonempty)
-    if name.endswith("_TEXT") or "Please explain" in qtext or "Please briefly" in qtext or "Please share" in qtext or max(len(v) for v in nonempty) > 120:
-        return "text"
-    if uniq.issubset(set(LIKERT5)|set(LIKELIHOOD5)|set(IMPORTANCE5)|set(Q55)|set(Q6)|set(Q30)):
+    if uniq <= LIKERT_UNION:
         return "Likert"
-    if uniq.issubset({"Yes","No"}) or len(uniq)<=10:
+    if uniq <= {"Yes","No"} or len(uniq)<=10:
         return "multi-choice"
     return "other"
 
 
+def mean(a):
+    # statistics.mean goes through exact Fraction arithmetic; the codes here
+    # are small ints, so plain division gives the same rounded result.
+    return sum(a)/len(a) if a else 0.0
+
+
+def median(a):
+    s = sorted(a)
+    mid = len(s)//2
+    return s[mid] if len(s) % 2 else (s[mid-1]+s[mid])/2
+
+
 def pearson(x,y):
     if len(x) < 3:
         return float('nan')
-    mx, my = statistics.mean(x), statistics.mean(y)
-    num = sum((a-mx)*(b-my) for a,b in zip(x,y))
-    denx = math.sqrt(sum((a-mx)**2 for a in x))
-    deny = math.sqrt(sum((b-my)**2 for b in y))
-    if denx == 0 or deny == 0:
+    # Normalized dot product of the mean-centered vectors.
+    mx, my = mean(x), mean(y)
+    xc = [a-mx for a in x]
+    yc = [b-my for b in y]
+    den = math.hypot(*xc)*math.hypot(*yc)
+    if den == 0:
         return float('nan')
-    return num/(denx*deny)
-
-
-def quote_theme(text):
-    t = text.lower()
-    if any(k in t for k in ["tuition", "afford", "loan", "cost", "debt", "expensive"]): return "cost"
-    if any(k in t for k in ["time", "years", "delay", "full-time", "hours", "workload"]): return "time"
-    if any(k in t for k in ["exam", "pass rate", "cpa prep", "study"]): return "exam difficulty"
-    if any(k in t for k in ["employer", "job offer", "promotion", "firm"]): return "employer support"
-    if any(k in t for k in ["150", "credit hour", "graduate degree", "master", "macc", "mba"]): return "education requirement"
-    if any(k in t for k in ["experience", "work experience", "2 years", "extra year"]): return "work experience requirement"
-    if any(k in t for k in ["earn", "salary", "lifetime", "return", "roi", "payoff", "career ladder"]): return "ROI/value"
-    if any(k in t for k in ["aware", "know", "confus", "pathway", "understand"]): return "awareness/confusion"
-    if any(k in t for k in ["low-income", "family", "access", "equity", "children"]): return "equity/access"
+    return sum(map(operator.mul, xc, yc))/den
+
+
+def quote_theme(lowered):
+    # Callers pass text that is already lowercased.
+    for pat, name in THEME_PATTERNS:
+        if pat.search(lowered): return name
     return "other"
 
 
 def redact(text):
-    text = re.sub(r"[\w\.-]+@[\w\.-]+", "[REDACTED_EMAIL]", text)
-    text = re.sub(r"\b\+?\d?[\d\-\(\) ]{8,}\b", "[REDACTED_PHONE]", text)
+    text = REDACT_EMAIL_RE.sub("[REDACTED_EMAIL]", text)
+    text = REDACT_PHONE_RE.sub("[REDACTED_PHONE]", text)
     return text.strip()
 
 
+def png_chunk(tag,data):
+    return len(data).to_bytes(4,'big')+tag+data+zlib.crc32(tag+data).to_bytes(4,'big')
+
+
+def fill_rect(img,width,x0,x1,y0,y1,color):
+    # img holds PNG scanlines: filter byte 0, then RGB for each pixel.
+    stride=1+width*3
+    run=color*max(0,x1-x0)
+    for yy in range(y0,y1):
+        off=yy*stride+1
+        img[off+x0*3:off+x0*3+len(run)]=run
+
+
+CHART_MARGINS=(120,40,60,120)  # left, right, top, bottom
+
+
+@functools.lru_cache(maxsize=None)
+def chart_template(width, height):
+    # Background, axes and PNG header only depend on the chart size, so every
+    # chart of a given size starts from the same prebuilt copy.
+    bg=bytes((255,255,255)); axis=bytes((40,40,40))
+    img=bytearray((b'\x00'+bg*width)*height)
+    lm,rm,tm,bm=CHART_MARGINS
+    plot_w=width-lm-rm; plot_h=height-tm-bm
+    fill_rect(img,width,lm,lm+plot_w+1,tm+plot_h,tm+plot_h+1,axis)
+    fill_rect(img,width,lm,lm+1,tm,tm+plot_h+1,axis)
+    head=b'\x89PNG\r\n\x1a\n'
+    head+=png_chunk(b'IHDR', width.to_bytes(4,'big')+height.to_bytes(4,'big')+b'\x08\x02\x00\x00\x00')
+    return head, bytes(img)
+
+
 def png_bar_chart(values, labels, title, outpath, width=1200, height=700):
     # Minimal PNG renderer with simple bars/axes (no external libs).
-    bg=(255,255,255); axis=(40,40,40); bar=(66,135,245)
-    img=[ [list(bg) for _ in range(width)] for _ in range(height)]
-    lm,rm,tm,bm=120,40,60,120
+    bar=bytes((66,135,245))
+    head,base=chart_template(width, height)
+    img=bytearray(base)
+    lm,rm,tm,bm=CHART_MARGINS
     plot_w=width-lm-rm; plot_h=height-tm-bm
-    # axes
-    for x in range(lm,lm+plot_w+1): img[tm+plot_h][x]=list(axis)
-    for y in range(tm,tm+plot_h+1): img[y][lm]=list(axis)
     n=len(values); maxv=max(values) if values else 1
     bw=max(10,int(plot_w/(n*1.4)))
     gap=bw//2
     x=lm+gap
     for v in values:
         h=0 if maxv==0 else int((v/maxv)*(plot_h-10))
-        for yy in range(tm+plot_h-h, tm+plot_h):
-            for xx in range(x, min(x+bw,lm+plot_w)):
-                img[yy][xx]=list(bar)
+        fill_rect(img,width,x,min(x+bw,lm+plot_w),tm+plot_h-h,tm+plot_h,bar)
         x+=bw+gap
     # write png
-    raw=b''
-    for row in img:
-        raw+=b'\x00'+bytes([c for px in row for c in px])
-    def chunk(tag,data):
-        return len(data).to_bytes(4,'big')+tag+data+zlib.crc32(tag+data).to_bytes(4,'big')
-    png=b'\x89PNG\r\n\x1a\n'
-    png+=chunk(b'IHDR', width.to_bytes(4,'big')+height.to_bytes(4,'big')+b'\x08\x02\x00\x00\x00')
-    png+=chunk(b'tEXt', f'Title\x00{title}'.encode('latin1','ignore'))
-    png+=chunk(b'IDAT', zlib.compress(raw,9))
-    png+=chunk(b'IEND', b'')
+    png=head
+    png+=png_chunk(b'tEXt', f'Title\x00{title}'.encode('latin1','ignore'))
+    png+=png_chunk(b'IDAT', zlib_impl.compress(img,1))
+    png+=png_chunk(b'IEND', b'')
     with open(outpath,'wb') as f: f.write(png)
 
 
@@ -189,14 +273,19 @@ def main():
     if not files:
         raise SystemExit("No .xlsx files found in /data or repo root")
 
-    all_data=[]; question_text={}
-    for f in files:
-        d,q=parse_xlsx(f)
-        all_data.extend(d)
+    # Workbooks are independent, so parse several of them in parallel.
+    parse=functools.partial(parse_xlsx, finished_only=True)
+    if len(files)>1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as ex:
+            parsed=list(ex.map(parse, files))
+    else:
+        parsed=[parse(f) for f in files]
+
+    rows=[]; question_text={}
+    for d,q in parsed:
+        rows.extend(d)
         question_text.update(q)
 
-    rows=[r for r in all_data if r.get('Finished','')=='1']
-
     # data dictionary
     fields=sorted(rows[0].keys())
     with open(os.path.join(ROOT,'analysis','data_dictionary.csv'),'w',newline='') as fh:
@@ -207,10 +296,12 @@ def main():
             miss=sum(1 for v in vals if v=='')/len(rows)
             q=question_text.get(field,'') or field
             t=classify_field(vals, field, q)
-            uniq=[]
+            seen=set(); uniq=[]
             for v in vals:
-                if v and v not in uniq: uniq.append(v)
-            value_labels=' | '.join(uniq[:12])
+                if v and v not in seen:
+                    seen.add(v); uniq.append(v)
+                    if len(uniq)==12: break
+            value_labels=' | '.join(uniq)
             w.writerow([field,q,t,value_labels,f"{miss:.4f}"])
 
     # top factors
@@ -220,24 +311,26 @@ def main():
         if v in LIKELIHOOD5: intent_scores.append((r,LIKELIHOOD5[v]))
     factor_out=[]
     for field,(label,mapv) in FACTOR_MAP.items():
-        vals=[]; intents=[]
-        for r,iscore in intent_scores:
-            v=r.get(field,'')
-            if v in mapv:
-                vals.append(mapv[v]); intents.append(iscore)
-        if not vals: continue
-        cnt=Counter(vals)
-        topbox=sum(1 for x in vals if x>=4)/len(vals)
+        # aligned (code, intent) columns for respondents who answered both
+        pairs=[(mapv[r[field]],iscore) for r,iscore in intent_scores if r.get(field,'') in mapv]
+        if not pairs: continue
+        # codes fit in a signed byte; keep them unboxed
+        vals,intents=(array.array('b', col) for col in zip(*pairs))
+        # codes are small ints (0/1 for Yes/No, 1-5 for scales), so count by value
+        hist=[vals.count(k) for k in range(6)]
+        topbox=sum(hist[4:])/len(vals)
+        pc=pearson(vals,intents)
         factor_out.append({
             'factor_field':field,
             'factor_label':label,
             'n':len(vals),
-            'mean':round(statistics.mean(vals),3),
-            'median':statistics.median(vals),
+            'mean':round(mean(vals),3),
+            'median':median(vals),
             'top_box_pct':round(topbox*100,1),
-            'pearson_with_intent':round(pearson(vals,intents),3),
-            'abs_corr':round(abs(pearson(vals,intents)),3) if not math.isnan(pearson(vals,intents)) else '',
-            'distribution':json.dumps(dict(sorted(cnt.items())))
+            'pearson_with_intent':round(pc,3),
+            'abs_corr':round(abs(pc),3) if not math.isnan(pc) else '',
+            # same text json.dumps gives for the {code: count} dict
+            'distribution':'{'+', '.join(f'"{k}": {c}' for k,c in enumerate(hist) if c)+'}'
         })
     factor_out.sort(key=lambda x:(x['abs_corr'] if x['abs_corr']!='' else -1), reverse=True)
     with open(os.path.join(ROOT,'analysis','rq1_top_factors.csv'),'w',newline='') as fh:
@@ -250,41 +343,45 @@ def main():
 
     # segmentation full-time vs part-time using intent mean
     seg=defaultdict(list)
-    for r,_ in intent_scores:
-        if r.get('Q16','') in ('Full-time','Part-time'):
-            seg[r['Q16']].append(LIKELIHOOD5[r['Q29']])
+    for r,iscore in intent_scores:
+        q16=r.get('Q16','')
+        if q16 in ('Full-time','Part-time'):
+            seg[q16].append(iscore)
     seg_labels=sorted(seg)
-    seg_vals=[round(statistics.mean(seg[k]),3) for k in seg_labels]
+    seg_vals=[round(mean(seg[k]),3) for k in seg_labels]
     png_bar_chart(seg_vals,seg_labels,'Mean CPA intent by enrollment status', os.path.join(ROOT,'figures','rq1_intent_by_status.png'))
 
     # awareness segmentation
     seg2=defaultdict(list)
-    for r,_ in intent_scores:
-        if r.get('Q53','') in ('Yes','No'):
-            seg2[r['Q53']].append(LIKELIHOOD5[r['Q29']])
+    for r,iscore in intent_scores:
+        q53=r.get('Q53','')
+        if q53 in ('Yes','No'):
+            seg2[q53].append(iscore)
     s2_labels=['No','Yes']
-    s2_vals=[round(statistics.mean(seg2[k]),3) if seg2.get(k) else 0 for k in s2_labels]
+    s2_vals=[round(mean(seg2[k]),3) if seg2.get(k) else 0 for k in s2_labels]
     png_bar_chart(s2_vals,s2_labels,'Mean CPA intent by pathway awareness', os.path.join(ROOT,'figures','rq1_intent_by_awareness.png'))
 
     # quotes
-    quotes=[]
     qcount=defaultdict(int)
     max_per_theme=4
-    for idx,r in enumerate(rows, start=5):
-        rid=r.get('ResponseId','') or f'row_{idx}'
-        for f in OPEN_ENDED_FIELDS:
-            txt=redact(r.get(f,''))
-            if len(txt)<30: continue
-            theme=quote_theme(txt)
-            if qcount[theme] >= max_per_theme: continue
-            sent=txt.split('\n')[0].strip()
-            if len(sent)>280: sent=sent[:277]+'...'
-            quotes.append({'ResponseID_or_row':rid,'question_field':f,'quote':sent,'theme_label':theme})
-            qcount[theme]+=1
-    # enforce 2-4 for major themes where possible
     with open(os.path.join(ROOT,'analysis','rq1_quotes.csv'),'w',newline='') as fh:
         w=csv.DictWriter(fh, fieldnames=['ResponseID_or_row','question_field','quote','theme_label'])
-        w.writeheader(); w.writerows(quotes)
+        w.writeheader()
+        for idx,r in enumerate(rows, start=5):
+            rid=r.get('ResponseId','') or f'row_{idx}'
+            for f in OPEN_ENDED_FIELDS:
+                raw=r.get(f,'')
+                # most respondents skip most open-ended items
+                if not raw: continue
+                txt=redact(raw)
+                if len(txt)<30: continue
+                theme=quote_theme(txt.lower())
+                # enforce 2-4 for major themes where possible
+                if qcount[theme] >= max_per_theme: continue
+                sent=txt.split('\n')[0].strip()
+                if len(sent)>280: sent=sent[:277]+'...'
+                w.writerow({'ResponseID_or_row':rid,'question_field':f,'quote':sent,'theme_label':theme})
+                qcount[theme]+=1
 
     print('Created files:')
     for p in [